@@ -5,6 +5,11 @@ from typing import TYPE_CHECKING
 
 import decky
 
+try:
+    import orjson
+except ImportError:  # optional speedup; not bundled in py_modules
+    orjson = None
+
 if TYPE_CHECKING:
     from typing import Protocol
 
@@ -14,7 +19,28 @@ if TYPE_CHECKING:
         _metadata_cache: dict
 
 
+def _dump_state_json(state):
+    """Serialize state to indented UTF-8 JSON bytes, via orjson when available."""
+    if orjson is not None:
+        return orjson.dumps(state, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS)
+    return json.dumps(state, indent=2).encode("utf-8")
+
+
+def _path_exists(path):
+    """os.path.exists equivalent (follows symlinks) used by _prune_stale_state."""
+    try:
+        os.stat(path)
+        return True
+    except (OSError, ValueError):
+        return False
+
+
 class StateMixin:
+    # Last payload _save_state wrote to state.json. Assumes this process is
+    # the only writer: an externally modified or deleted file is not
+    # restored until the state itself changes.
+    _state_written = None
+
     def _load_settings(self):
         settings_path = os.path.join(
             decky.DECKY_PLUGIN_SETTINGS_DIR, "settings.json"
@@ -52,7 +78,7 @@ class StateMixin:
     def _load_state(self):
         state_path = os.path.join(decky.DECKY_PLUGIN_RUNTIME_DIR, "state.json")
         try:
-            with open(state_path, "r") as f:
+            with open(state_path, "r", encoding="utf-8") as f:
                 saved = json.load(f)
             self._state.update(saved)
         except (FileNotFoundError, json.JSONDecodeError):
@@ -60,28 +86,60 @@ class StateMixin:
 
     def _prune_stale_state(self):
         """Remove installed_roms entries whose files no longer exist on disk."""
-        pruned = []
-        for rom_id, entry in list(self._state["installed_roms"].items()):
-            file_path = entry.get("file_path", "")
-            rom_dir = entry.get("rom_dir", "")
-            # Keep if either the file or the rom_dir still exists
-            if (file_path and os.path.exists(file_path)) or (rom_dir and os.path.exists(rom_dir)):
+        installed = self._state["installed_roms"]
+        # Group referenced paths by parent dir so each dir is listed once with
+        # scandir — installed ROMs cluster in a handful of system dirs.
+        by_parent = {}
+        for entry in installed.values():
+            for path in (entry.get("file_path", ""), entry.get("rom_dir", "")):
+                if path:
+                    # No normpath: ".." must resolve after symlinks, as in os.stat
+                    parent, name = os.path.split(path.rstrip(os.sep) or path)
+                    by_parent.setdefault(parent, []).append((name, path))
+
+        alive = set()
+        for parent, names in by_parent.items():
+            wanted = {name for name, _ in names}
+            try:
+                with os.scandir(parent or ".") as it:
+                    # Symlinks only count with a live target (e.g. unmounted SD card)
+                    present = {
+                        e.name for e in it
+                        if e.name in wanted and (not e.is_symlink() or _path_exists(e.path))
+                    }
+            except (FileNotFoundError, NotADirectoryError, ValueError):
                 continue
-            decky.logger.info(f"Pruned stale installed_roms entry: {rom_id} ({file_path})")
-            pruned.append(rom_id)
+            except OSError:
+                # Unreadable dir, fall back to a stat per path
+                present = {name for name, path in names if _path_exists(path)}
+            alive.update(path for name, path in names if name in present)
+
+        # Keep if either the file or the rom_dir still exists
+        pruned = [
+            rom_id for rom_id, entry in installed.items()
+            if not {entry.get("file_path", ""), entry.get("rom_dir", "")} & alive
+        ]
         for rom_id in pruned:
-            del self._state["installed_roms"][rom_id]
+            decky.logger.info(
+                f"Pruned stale installed_roms entry: {rom_id} ({installed[rom_id].get('file_path', '')})"
+            )
+            del installed[rom_id]
         if pruned:
             self._save_state()
 
     def _save_state(self):
+        data = _dump_state_json(self._state)
+        # Skip the disk write when nothing changed since the last save
+        if data == self._state_written:
+            return
         state_dir = decky.DECKY_PLUGIN_RUNTIME_DIR
         os.makedirs(state_dir, exist_ok=True)
         state_path = os.path.join(state_dir, "state.json")
         tmp_path = state_path + ".tmp"
-        with open(tmp_path, "w") as f:
-            json.dump(self._state, f, indent=2)
+        with open(tmp_path, "wb") as f:
+            f.write(data)
         os.replace(tmp_path, state_path)
+        self._state_written = data
 
     def _load_metadata_cache(self):
         cache_path = os.path.join(decky.DECKY_PLUGIN_RUNTIME_DIR, "metadata_cache.json")
@@ -1,7 +1,7 @@
 import os
-import struct
 import binascii
 import json
+import functools
 from typing import TYPE_CHECKING
 
 import decky
@@ -15,6 +15,13 @@ if TYPE_CHECKING:
         _state: dict
 
 
+@functools.lru_cache(maxsize=1024)
+def _crc_base(exe, appname):
+    """CRC32 of exe + appname with the high bit set, shared by app and artwork IDs."""
+    # binascii.crc32 is C-backed and already unsigned on Python 3
+    return binascii.crc32((exe + appname).encode("utf-8")) | 0x80000000
+
+
 class SteamConfigMixin:
     def _find_steam_user_dir(self):
         """Find the active Steam user's userdata directory."""
@@ -49,15 +56,12 @@ class SteamConfigMixin:
     # Deprecated: frontend now gets app_id from SteamClient.Apps.AddShortcut()
     def _generate_app_id(self, exe, appname):
         """Generate Steam shortcut app ID (signed int32). Deprecated."""
-        key = exe + appname
-        crc = binascii.crc32(key.encode("utf-8")) & 0xFFFFFFFF
-        return struct.unpack("i", struct.pack("I", crc | 0x80000000))[0]
+        # High bit is always set, so the signed int32 is just base - 2**32
+        return _crc_base(exe, appname) - 0x100000000
 
     def _generate_artwork_id(self, exe, appname):
         """Generate unsigned artwork ID for grid filenames."""
-        key = exe + appname
-        crc = binascii.crc32(key.encode("utf-8")) & 0xFFFFFFFF
-        return crc | 0x80000000
+        return _crc_base(exe, appname)
 
     # Deprecated: VDF read/write replaced by frontend SteamClient API
     def _read_shortcuts(self):
@@ -1,17 +1,86 @@
 import sys
 import os
-import logging
+import types
 import tempfile
-from unittest.mock import MagicMock, AsyncMock
+from unittest.mock import AsyncMock
 
-# Create mock decky module before any imports of main
-mock_decky = MagicMock()
+import pytest
+
+
+def _noop(*args, **kwargs):
+    pass
+
+
+# Install a stub decky module once, before any imports of main. The logger is
+# a plain namespace so tests can monkeypatch individual methods cheaply.
+mock_decky = types.ModuleType("decky")
 mock_decky.DECKY_PLUGIN_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 mock_decky.DECKY_PLUGIN_SETTINGS_DIR = tempfile.mkdtemp()
 mock_decky.DECKY_PLUGIN_RUNTIME_DIR = tempfile.mkdtemp()
 mock_decky.DECKY_PLUGIN_LOG_DIR = tempfile.mkdtemp()
 mock_decky.DECKY_USER_HOME = os.path.expanduser("~")
-mock_decky.logger = logging.getLogger("test_romm")
+mock_decky.logger = types.SimpleNamespace(info=_noop, warning=_noop, error=_noop)
 mock_decky.emit = AsyncMock()
 
 sys.modules["decky"] = mock_decky
+
+from main import Plugin  # noqa: E402
+
+# Shared shape for the plugin fixture; copied per test, never handed out directly
+_TEMPLATE_SETTINGS = {"romm_url": "", "romm_user": "", "romm_pass": "", "enabled_platforms": {}}
+_TEMPLATE_STATE = {"shortcut_registry": {}, "installed_roms": {}, "last_sync": None, "sync_stats": {}}
+
+
+@pytest.fixture(scope="module")
+def _plugin_singleton():
+    return Plugin()
+
+
+@pytest.fixture
+def plugin(_plugin_singleton):
+    p = _plugin_singleton
+    # Deep reset: drop anything a previous test set on the instance (loop,
+    # _state_written, _save_sync_state, ...) before re-seeding the defaults
+    p.__dict__.clear()
+    p.settings = {**_TEMPLATE_SETTINGS, "enabled_platforms": {}}
+    p._sync_running = False
+    p._sync_cancel = False
+    p._sync_progress = {"running": False}
+    p._state = {k: ({} if isinstance(v, dict) else v) for k, v in _TEMPLATE_STATE.items()}
+    p._pending_sync = {}
+    p._download_tasks = {}
+    p._download_queue = {}
+    p._download_in_progress = set()
+    p._metadata_cache = {}
+    return p
+
+
+@pytest.fixture
+def tmp_path_str(tmp_path):
+    return str(tmp_path)
+
+
+@pytest.fixture
+def plugin_dirs(plugin, tmp_path, tmp_path_str, monkeypatch):
+    """Plugin with decky settings/runtime dirs pointed at tmp_path for this test."""
+    monkeypatch.setattr(mock_decky, "DECKY_PLUGIN_SETTINGS_DIR", tmp_path_str)
+    monkeypatch.setattr(mock_decky, "DECKY_PLUGIN_RUNTIME_DIR", tmp_path_str)
+    return plugin, tmp_path
+
+
+class _CallRecorder:
+    """Minimal stand-in for a logger method that records (args, kwargs) per call."""
+
+    def __init__(self):
+        self.calls = []
+
+    def __call__(self, *args, **kwargs):
+        self.calls.append((args, kwargs))
+
+
+@pytest.fixture
+def log_capture(monkeypatch):
+    """Replace decky.logger.info with a call recorder (cheaper than patch.object)."""
+    rec = _CallRecorder()
+    monkeypatch.setattr(mock_decky.logger, "info", rec)
+    return rec
@@ -3,105 +3,75 @@ import json
 import os
 
 # conftest.py patches decky before this import
-from main import Plugin
+import decky
+import lib.state
 
-
-@pytest.fixture
-def plugin():
-    p = Plugin()
-    p.settings = {"romm_url": "", "romm_user": "", "romm_pass": "", "enabled_platforms": {}}
-    p._sync_running = False
-    p._sync_cancel = False
-    p._sync_progress = {"running": False}
-    p._state = {"shortcut_registry": {}, "installed_roms": {}, "last_sync": None, "sync_stats": {}}
-    p._pending_sync = {}
-    p._download_tasks = {}
-    p._download_queue = {}
-    p._download_in_progress = set()
-    p._metadata_cache = {}
-    return p
+# Cheap, self-contained tests — keep them on one worker under --dist loadgroup
+pytestmark = pytest.mark.xdist_group("state")
 
 
 class TestSettings:
+    @pytest.mark.parametrize("stored, mask_expected", [
+        ("secret123", "••••"),
+        ("", ""),
+    ])
     @pytest.mark.asyncio
-    async def test_get_settings_masks_password(self, plugin):
-        plugin.settings["romm_pass"] = "secret123"
-        result = await plugin.get_settings()
-        assert result["romm_pass_masked"] == "••••"
-        assert "secret123" not in str(result)
-
-    @pytest.mark.asyncio
-    async def test_get_settings_empty_password(self, plugin):
-        plugin.settings["romm_pass"] = ""
+    async def test_get_settings_masks_password(self, plugin, stored, mask_expected):
+        plugin.settings["romm_pass"] = stored
         result = await plugin.get_settings()
-        assert result["romm_pass_masked"] == ""
-
+        assert result["romm_pass_masked"] == mask_expected
+        if stored:
+            assert stored not in str(result)
+
+    @pytest.mark.parametrize("stored, submitted, expected", [
+        pytest.param("original", "••••", "original", id="skips-masked"),
+        pytest.param("old", "newpass", "newpass", id="updates-real"),
+    ])
     @pytest.mark.asyncio
-    async def test_save_settings_skips_masked_password(self, plugin, tmp_path):
-        import decky
-        decky.DECKY_PLUGIN_SETTINGS_DIR = str(tmp_path)
-        plugin.settings["romm_pass"] = "original"
-        await plugin.save_settings("http://example.com", "user", "••••")
-        assert plugin.settings["romm_pass"] == "original"
-
-    @pytest.mark.asyncio
-    async def test_save_settings_updates_real_password(self, plugin, tmp_path):
-        import decky
-        decky.DECKY_PLUGIN_SETTINGS_DIR = str(tmp_path)
-        plugin.settings["romm_pass"] = "old"
-        await plugin.save_settings("http://example.com", "user", "newpass")
-        assert plugin.settings["romm_pass"] == "newpass"
+    async def test_save_settings_password(self, plugin_dirs, stored, submitted, expected):
+        plugin, _ = plugin_dirs
+        plugin.settings["romm_pass"] = stored
+        await plugin.save_settings("http://example.com", "user", submitted)
+        assert plugin.settings["romm_pass"] == expected
 
 
 class TestDebugLogging:
-    def test_log_debug_enabled(self, plugin):
+    def test_log_debug_enabled(self, plugin, log_capture):
         """_log_debug logs when debug_logging is True."""
-        from unittest.mock import patch
-        import decky
         plugin.settings["debug_logging"] = True
-        with patch.object(decky.logger, "info") as mock_info:
-            plugin._log_debug("test message")
-            mock_info.assert_called_once_with("test message")
+        plugin._log_debug("test message")
+        assert log_capture.calls == [(("test message",), {})]
 
-    def test_log_debug_disabled(self, plugin):
+    def test_log_debug_disabled(self, plugin, log_capture):
         """_log_debug does not log when debug_logging is False."""
-        from unittest.mock import patch
-        import decky
         plugin.settings["debug_logging"] = False
-        with patch.object(decky.logger, "info") as mock_info:
-            plugin._log_debug("test message")
-            mock_info.assert_not_called()
+        plugin._log_debug("test message")
+        assert not log_capture.calls
 
-    def test_log_debug_missing_setting(self, plugin):
+    def test_log_debug_missing_setting(self, plugin, log_capture):
         """_log_debug does not log when debug_logging key is missing."""
-        from unittest.mock import patch
-        import decky
         plugin.settings.pop("debug_logging", None)
-        with patch.object(decky.logger, "info") as mock_info:
-            plugin._log_debug("test message")
-            mock_info.assert_not_called()
+        plugin._log_debug("test message")
+        assert not log_capture.calls
 
     @pytest.mark.asyncio
-    async def test_save_debug_logging_enables(self, plugin, tmp_path):
-        import decky
-        decky.DECKY_PLUGIN_SETTINGS_DIR = str(tmp_path)
+    async def test_save_debug_logging_enables(self, plugin_dirs):
+        plugin, _ = plugin_dirs
         result = await plugin.save_debug_logging(True)
         assert result["success"] is True
         assert plugin.settings["debug_logging"] is True
 
     @pytest.mark.asyncio
-    async def test_save_debug_logging_disables(self, plugin, tmp_path):
-        import decky
-        decky.DECKY_PLUGIN_SETTINGS_DIR = str(tmp_path)
+    async def test_save_debug_logging_disables(self, plugin_dirs):
+        plugin, _ = plugin_dirs
         plugin.settings["debug_logging"] = True
         result = await plugin.save_debug_logging(False)
         assert result["success"] is True
         assert plugin.settings["debug_logging"] is False
 
     @pytest.mark.asyncio
-    async def test_save_debug_logging_coerces_to_bool(self, plugin, tmp_path):
-        import decky
-        decky.DECKY_PLUGIN_SETTINGS_DIR = str(tmp_path)
+    async def test_save_debug_logging_coerces_to_bool(self, plugin_dirs):
+        plugin, _ = plugin_dirs
         await plugin.save_debug_logging(1)
         assert plugin.settings["debug_logging"] is True
         await plugin.save_debug_logging(0)
@@ -120,143 +90,201 @@ class TestDebugLogging:
         assert result["debug_logging"] is False
 
     @pytest.mark.asyncio
-    async def test_sgdb_artwork_silent_when_debug_off(self, plugin, tmp_path):
+    async def test_sgdb_artwork_silent_when_debug_off(self, plugin_dirs, log_capture):
         """SGDB artwork info calls should not log when debug_logging is False."""
-        from unittest.mock import patch
-        import decky
-        decky.DECKY_PLUGIN_RUNTIME_DIR = str(tmp_path)
+        plugin, _ = plugin_dirs
 
         plugin.settings["debug_logging"] = False
-        with patch.object(decky.logger, "info") as mock_info:
-            # Call with an invalid asset_type_num to trigger early return after the debug log
-            result = await plugin.get_sgdb_artwork_base64(1, 99)
-            assert result["base64"] is None
-            # The SGDB artwork request log should NOT have been called since debug is off
-            for call in mock_info.call_args_list:
-                assert "SGDB artwork" not in str(call)
+        # Call with an invalid asset_type_num to trigger early return after the debug log
+        result = await plugin.get_sgdb_artwork_base64(1, 99)
+        assert result["base64"] is None
+        # The SGDB artwork request log should NOT have been called since debug is off
+        assert not any("SGDB artwork" in str(a[0]) for a, _ in log_capture.calls if a)
 
     @pytest.mark.asyncio
-    async def test_sgdb_artwork_logs_when_debug_enabled(self, plugin, tmp_path):
+    async def test_sgdb_artwork_logs_when_debug_enabled(self, plugin_dirs, log_capture):
         """SGDB artwork info calls should log when debug_logging is True."""
-        from unittest.mock import patch
-        import decky
-        decky.DECKY_PLUGIN_RUNTIME_DIR = str(tmp_path)
+        plugin, _ = plugin_dirs
 
         plugin.settings["debug_logging"] = True
         # asset_type 1 = hero, no API key -> will log "skipped: no API key"
         plugin.settings["steamgriddb_api_key"] = ""
         plugin._state["shortcut_registry"]["1"] = {"sgdb_id": None, "igdb_id": None}
-        with patch.object(decky.logger, "info") as mock_info:
-            result = await plugin.get_sgdb_artwork_base64(1, 1)
-            assert result["no_api_key"] is True
-            # Should have logged debug messages
-            logged_msgs = [str(c) for c in mock_info.call_args_list]
-            assert any("SGDB artwork" in m for m in logged_msgs)
-
-
-class TestPruneStaleState:
-    def test_prunes_missing_files(self, plugin, tmp_path):
-        import decky
-        decky.DECKY_PLUGIN_RUNTIME_DIR = str(tmp_path)
-
-        plugin._state["installed_roms"] = {
-            "1": {"rom_id": 1, "file_path": "/nonexistent/game.z64", "system": "n64"},
-        }
-
-        plugin._prune_stale_state()
-        assert "1" not in plugin._state["installed_roms"]
-
-    def test_keeps_existing_files(self, plugin, tmp_path):
-        import decky
-        decky.DECKY_PLUGIN_RUNTIME_DIR = str(tmp_path)
+        result = await plugin.get_sgdb_artwork_base64(1, 1)
+        assert result["no_api_key"] is True
+        # Should have logged debug messages
+        assert any("SGDB artwork" in str(a[0]) for a, _ in log_capture.calls if a)
 
-        rom_file = tmp_path / "game.z64"
-        rom_file.write_text("data")
 
-        plugin._state["installed_roms"] = {
-            "1": {"rom_id": 1, "file_path": str(rom_file), "system": "n64"},
-        }
+_RUNTIME_DIR = "/runtime"
 
-        plugin._prune_stale_state()
-        assert "1" in plugin._state["installed_roms"]
 
-    def test_keeps_existing_rom_dir(self, plugin, tmp_path):
-        import decky
-        decky.DECKY_PLUGIN_RUNTIME_DIR = str(tmp_path)
+@pytest.fixture
+def rom_tree(request, fs, monkeypatch):
+    """In-memory runtime dir holding the given files (or dirs, with a trailing slash).
+
+    Relative paths land under the runtime dir; absolute paths are created as-is.
+    "link -> target" creates a symlink.
+    """
+    monkeypatch.setattr(decky, "DECKY_PLUGIN_RUNTIME_DIR", _RUNTIME_DIR)
+    fs.create_dir(_RUNTIME_DIR)
+    for rel in request.param:
+        if " -> " in rel:
+            link, target = rel.split(" -> ")
+            fs.create_symlink(os.path.join(_RUNTIME_DIR, link), os.path.join(_RUNTIME_DIR, target))
+            continue
+        path = os.path.join(_RUNTIME_DIR, rel)
+        if rel.endswith("/"):
+            fs.create_dir(path)
+        else:
+            fs.create_file(path, contents="data")
+    return _RUNTIME_DIR
 
-        rom_dir = tmp_path / "FF7"
-        rom_dir.mkdir()
 
-        plugin._state["installed_roms"] = {
-            "1": {
+class TestPruneStaleState:
+    @pytest.mark.parametrize("rom_tree, installed, expected_keys, expect_state_file", [
+        pytest.param([], {}, set(), False, id="empty"),
+        pytest.param(
+            [],
+            {"1": {"rom_id": 1, "file_path": "/nonexistent/game.z64", "system": "n64"}},
+            set(), True, id="missing-file",
+        ),
+        pytest.param(
+            ["game.z64"],
+            {"1": {"rom_id": 1, "file_path": "/runtime/game.z64", "system": "n64"}},
+            {"1"}, False, id="keeps-existing-file",
+        ),
+        pytest.param(
+            ["FF7/"],
+            {"1": {
                 "rom_id": 1,
-                "file_path": str(rom_dir / "FF7.m3u"),  # file missing but dir exists
-                "rom_dir": str(rom_dir),
+                "file_path": "/runtime/FF7/FF7.m3u",  # file missing but dir exists
+                "rom_dir": "/runtime/FF7",
                 "system": "psx",
+            }},
+            {"1"}, False, id="keeps-rom-dir",
+        ),
+        pytest.param(
+            ["game.z64"],
+            {
+                "1": {"rom_id": 1, "file_path": "/runtime/game.z64", "system": "n64"},
+                "2": {"rom_id": 2, "file_path": "/gone/game.z64", "system": "snes"},
             },
-        }
+            {"1"}, True, id="mixed",
+        ),
+        pytest.param(
+            [],
+            {
+                "1": {"rom_id": 1, "file_path": "/gone/a.z64", "system": "n64"},
+                "2": {"rom_id": 2, "file_path": "/gone/b.z64", "system": "snes"},
+                "3": {"rom_id": 3, "file_path": "/gone/c.z64", "system": "gb"},
+            },
+            set(), True, id="all-stale",
+        ),
+        pytest.param(
+            ["n64/", "n64/a.z64"],
+            {
+                "1": {"rom_id": 1, "file_path": "/runtime/n64/a.z64", "system": "n64"},
+                "2": {"rom_id": 2, "file_path": "/runtime/n64/b.z64", "system": "n64"},
+                "3": {"rom_id": 3, "file_path": "/runtime/n64/a.z64/nested.z64", "system": "n64"},
+            },
+            {"1"}, True, id="shared-parent-dir",
+        ),
+        pytest.param(
+            ["/home/deck/retrodeck/roms/n64/a.z64"],
+            {"1": {"rom_id": 1, "file_path": "/home/deck/retrodeck/roms/n64/a.z64", "system": "n64"}},
+            {"1"}, False, id="rom-outside-runtime-dir",
+        ),
+        pytest.param(
+            ["game.z64 -> sdcard/game.z64"],
+            {"1": {"rom_id": 1, "file_path": "/runtime/game.z64", "system": "n64"}},
+            set(), True, id="dangling-symlink",
+        ),
+        pytest.param(
+            ["sdcard/game.z64", "game.z64 -> sdcard/game.z64"],
+            {"1": {"rom_id": 1, "file_path": "/runtime/game.z64", "system": "n64"}},
+            {"1"}, False, id="live-symlink",
+        ),
+        pytest.param(
+            ["loop -> loop"],
+            {"1": {"rom_id": 1, "file_path": "/runtime/loop/game.z64", "system": "n64"}},
+            set(), True, id="symlink-loop-parent",
+        ),
+    ], indirect=["rom_tree"])
+    def test_prune(self, plugin, rom_tree, installed, expected_keys, expect_state_file):
+        plugin._state["installed_roms"] = {rom_id: dict(entry) for rom_id, entry in installed.items()}
 
         plugin._prune_stale_state()
-        assert "1" in plugin._state["installed_roms"]
-
-    def test_saves_state_only_when_pruned(self, plugin, tmp_path):
-        import decky
-        decky.DECKY_PLUGIN_RUNTIME_DIR = str(tmp_path)
-
-        rom_file = tmp_path / "game.z64"
-        rom_file.write_text("data")
-
+        assert set(plugin._state["installed_roms"]) == expected_keys
+        # state.json is only written when something was pruned
+        assert os.path.exists(os.path.join(rom_tree, "state.json")) is expect_state_file
+
+    def test_keeps_dotdot_path_through_symlink(self, plugin_dirs):
+        # Real FS: pyfakefs collapses ".." textually instead of after the symlink
+        plugin, tmp_path = plugin_dirs
+        (tmp_path / "x" / "y").mkdir(parents=True)
+        (tmp_path / "x" / "other").mkdir()
+        (tmp_path / "x" / "other" / "b.z64").write_text("data")
+        (tmp_path / "a").mkdir()
+        (tmp_path / "a" / "link").symlink_to(tmp_path / "x" / "y")
         plugin._state["installed_roms"] = {
-            "1": {"rom_id": 1, "file_path": str(rom_file), "system": "n64"},
+            "1": {"rom_id": 1, "file_path": f"{tmp_path}/a/link/../other/b.z64", "system": "n64"},
         }
 
-        # No pruning needed — state file should NOT be written
-        state_path = tmp_path / "state.json"
         plugin._prune_stale_state()
-        assert not state_path.exists()
-
-    def test_prunes_mixed(self, plugin, tmp_path):
-        import decky
-        decky.DECKY_PLUGIN_RUNTIME_DIR = str(tmp_path)
-
-        rom_file = tmp_path / "game.z64"
-        rom_file.write_text("data")
+        assert "1" in plugin._state["installed_roms"]
 
+    def test_prunes_path_with_embedded_nul(self, plugin_dirs):
+        # os.scandir raises ValueError rather than OSError for these
+        plugin, tmp_path = plugin_dirs
         plugin._state["installed_roms"] = {
-            "1": {"rom_id": 1, "file_path": str(rom_file), "system": "n64"},
-            "2": {"rom_id": 2, "file_path": "/gone/game.z64", "system": "snes"},
+            "1": {"rom_id": 1, "file_path": f"{tmp_path}/ba\x00d/game.z64", "system": "n64"},
         }
 
         plugin._prune_stale_state()
-        assert "1" in plugin._state["installed_roms"]
-        assert "2" not in plugin._state["installed_roms"]
-
-
-class TestPruneStaleStateEdgeCases:
-    """Edge case tests for _prune_stale_state."""
-
-    def test_empty_installed_roms_no_crash(self, plugin, tmp_path):
-        import decky
-        decky.DECKY_PLUGIN_RUNTIME_DIR = str(tmp_path)
-
-        plugin._state["installed_roms"] = {}
-        plugin._prune_stale_state()
-        # Should not crash, _save_state should NOT be called
-        state_path = tmp_path / "state.json"
-        assert not state_path.exists()
+        assert plugin._state["installed_roms"] == {}
 
-    def test_all_entries_stale(self, plugin, tmp_path):
-        import decky
-        decky.DECKY_PLUGIN_RUNTIME_DIR = str(tmp_path)
 
-        plugin._state["installed_roms"] = {
-            "1": {"rom_id": 1, "file_path": "/gone/a.z64", "system": "n64"},
-            "2": {"rom_id": 2, "file_path": "/gone/b.z64", "system": "snes"},
-            "3": {"rom_id": 3, "file_path": "/gone/c.z64", "system": "gb"},
-        }
+class TestSaveState:
+    def test_writes_state_atomically(self, plugin_dirs):
+        plugin, tmp_path = plugin_dirs
+        plugin._state["last_sync"] = "2026-01-01T00:00:00"
+        plugin._save_state()
+        assert json.loads((tmp_path / "state.json").read_text())["last_sync"] == "2026-01-01T00:00:00"
+        assert not (tmp_path / "state.json.tmp").exists()
 
-        plugin._prune_stale_state()
-        assert plugin._state["installed_roms"] == {}
-        # _save_state should have been called (state.json written)
+    def test_skips_write_when_unchanged(self, plugin_dirs, monkeypatch):
+        plugin, tmp_path = plugin_dirs
         state_path = tmp_path / "state.json"
-        assert state_path.exists()
+        replaced = []
+        real_replace = os.replace
+
+        def recording_replace(src, dst):
+            replaced.append(dst)
+            real_replace(src, dst)
+
+        monkeypatch.setattr("lib.state.os.replace", recording_replace)
+        plugin._save_state()
+        assert replaced == [str(state_path)]
+
+        plugin._save_state()
+        assert replaced == [str(state_path)]
+
+        plugin._state["installed_roms"]["1"] = {"rom_id": 1, "file_path": "/roms/a.z64"}
+        plugin._save_state()
+        assert replaced == [str(state_path)] * 2
+        assert "1" in json.loads(state_path.read_text())["installed_roms"]
+
+    @pytest.mark.parametrize("use_orjson", [True, False])
+    def test_round_trips_through_load_state(self, plugin_dirs, monkeypatch, use_orjson):
+        if not use_orjson:
+            monkeypatch.setattr(lib.state, "orjson", None)
+        elif lib.state.orjson is None:
+            pytest.skip("orjson not installed")
+        plugin, _ = plugin_dirs
+        plugin._state["shortcut_registry"]["7"] = {"app_id": -123, "name": "Pokémon"}
+        plugin._save_state()
+
+        plugin._state = {"shortcut_registry": {}}
+        plugin._load_state()
+        assert plugin._state["shortcut_registry"]["7"] == {"app_id": -123, "name": "Pokémon"}
@@ -1,23 +1,7 @@
-import pytest
-
-# conftest.py patches decky before this import
-from main import Plugin
+import binascii
+import struct
 
-
-@pytest.fixture
-def plugin():
-    p = Plugin()
-    p.settings = {"romm_url": "", "romm_user": "", "romm_pass": "", "enabled_platforms": {}}
-    p._sync_running = False
-    p._sync_cancel = False
-    p._sync_progress = {"running": False}
-    p._state = {"shortcut_registry": {}, "installed_roms": {}, "last_sync": None, "sync_stats": {}}
-    p._pending_sync = {}
-    p._download_tasks = {}
-    p._download_queue = {}
-    p._download_in_progress = set()
-    p._metadata_cache = {}
-    return p
+import pytest
 
 
 class TestAppIdGeneration:
@@ -31,6 +15,11 @@ class TestAppIdGeneration:
         id2 = plugin._generate_app_id("/path/exe", "Game")
         assert id1 == id2
 
+    def test_matches_struct_signed_conversion(self, plugin):
+        crc = binascii.crc32(b"/path/exeGame") | 0x80000000
+        expected = struct.unpack("i", struct.pack("I", crc))[0]
+        assert plugin._generate_app_id("/path/exe", "Game") == expected
+
     def test_different_names_different_ids(self, plugin):
         id1 = plugin._generate_app_id("/path/exe", "Game A")
         id2 = plugin._generate_app_id("/path/exe", "Game B")
@@ -46,3 +35,8 @@ class TestArtworkIdGeneration:
         # artwork_id and app_id should share the same CRC base
         art_id = plugin._generate_artwork_id("/path/exe", "Game")
         assert art_id & 0x80000000  # High bit set
+
+    def test_shares_crc_base_with_app_id(self, plugin):
+        art_id = plugin._generate_artwork_id("/path/exe", "Game")
+        app_id = plugin._generate_app_id("/path/exe", "Game")
+        assert art_id == app_id & 0xFFFFFFFF